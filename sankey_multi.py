@@ -1,28 +1,73 @@
 # Minimal helper to split long-span links into adjacent-layer chains by inserting dummy nodes.
 # This module aims to be small and easy to test; later it can be integrated into the full pipeline.
 
+from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional
 import itertools
 
-def _get_node_layer(node: Dict, segments: Optional[List[str]]) -> Optional[int]:
+# link keys that are rewritten when building chain links; everything else is
+# carried over as metadata
+_SKIP_KEYS = frozenset({'source', 'target', 'value'})
+
+
+# Internal slotted representations: a dict per link/node costs ~200 bytes plus
+# per-key hashing; slots store the fields inline and make attribute access a
+# direct offset read. Dicts are converted at the input/output boundary only.
+
+@dataclass(slots=True)
+class _Link:
+    source: str
+    target: str
+    value: float
+    meta: Dict = field(default_factory=dict)
+    # pass-through links must round-trip to the exact input dict shape, so
+    # a missing 'value' key is remembered rather than materialized as 0
+    has_value: bool = True
+
+    def to_dict(self) -> Dict:
+        d = dict(self.meta)
+        d['source'] = self.source
+        d['target'] = self.target
+        if self.has_value:
+            d['value'] = self.value
+        return d
+
+
+@dataclass(slots=True)
+class _Node:
+    id: str
+    segment: Optional[int] = None
+    dummy: bool = False
+    orig_link_index: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "label": None,
+            "segment": self.segment,
+            "dummy": self.dummy,
+            "orig_link_index": self.orig_link_index,
+        }
+
+
+def _get_node_layer(node: _Node, seg_to_idx: Optional[Dict[str, int]]) -> Optional[int]:
     """
     Return integer layer index for node or None if unknown.
-    Node['segment'] may be integer or string (segment name).
+    node.segment may be integer or string (segment name); string names are
+    resolved through seg_to_idx, a precomputed {name: index} map.
     """
-    seg = node.get("segment", None)
+    seg = node.segment
     if seg is None:
         return None
     if isinstance(seg, int):
         return seg
     if isinstance(seg, str):
-        if segments is None:
-            return None
-        try:
-            return segments.index(seg)
-        except ValueError:
+        if seg_to_idx is None:
             return None
+        return seg_to_idx.get(seg)
     return None
 
+
 def split_long_links(nodes: List[Dict], links: List[Dict], segments: Optional[List[str]] = None
                      ) -> Tuple[List[Dict], List[Dict]]:
     """
@@ -34,74 +79,91 @@ def split_long_links(nodes: List[Dict], links: List[Dict], segments: Optional[Li
     Returns (new_nodes, new_links). Dummy nodes have keys:
       { 'id': '__dummy_{incremental}', 'label': None, 'segment': layer_index, 'dummy': True, 'orig_link': link_index }
     """
-    node_map = {n['id']: n for n in nodes}
-    # compute node layers
-    layer_map = {}
-    for n in nodes:
-        layer = _get_node_layer(n, segments)
-        if layer is not None:
-            layer_map[n['id']] = layer
-
-    new_nodes = list(nodes)  # shallow copy
-    new_links = []
+    # only membership is ever checked, so a set is enough (and cheaper than
+    # a full id -> node dict)
+    node_ids = {n['id'] for n in nodes}
+    # resolve segment names to indexes once, so layer lookup is a hash hit
+    # instead of a linear list.index scan per node
+    seg_to_idx = {name: i for i, name in enumerate(segments)} if segments else None
+    # compute node layers for every node (value may be None); populating all
+    # ids up front means the loop below can index layer_map directly instead
+    # of calling .get with a sentinel
+    layer_map = {n['id']: _get_node_layer(_Node(id=n['id'], segment=n.get('segment')), seg_to_idx)
+                 for n in nodes}
+
+    # convert links to the slotted internal form once
+    int_links = [_Link(source=l['source'], target=l['target'], value=l.get('value', 0),
+                       meta={k: v for k, v in l.items() if k not in _SKIP_KEYS},
+                       has_value='value' in l)
+                 for l in links]
+
+    dummy_nodes: List[_Node] = []
+    # preallocate the output list to an upper bound (a link spanning L layers
+    # expands into L adjacent edges) so appends never trigger a regrow
+    cap = sum(max(1, abs((layer_map.get(l.target) or 0) - (layer_map.get(l.source) or 0)))
+              for l in int_links)
+    new_links: List[_Link] = [None] * cap
+    idx = 0
     dummy_counter = itertools.count(1)
 
-    for li, link in enumerate(links):
-        src = link['source']
-        tgt = link['target']
-        val = link.get('value', 0)
-        if src not in node_map or tgt not in node_map:
+    # local bindings: LOAD_FAST beats repeated attribute lookups in the loop
+    dummy_nodes_append = dummy_nodes.append
+
+    for li, link in enumerate(int_links):
+        src = link.source
+        tgt = link.target
+        val = link.value
+        if src not in node_ids or tgt not in node_ids:
             # preserve link as-is if nodes missing (parser should validate earlier)
-            new_links.append(dict(link))
+            new_links[idx] = link
+            idx += 1
             continue
-        src_layer = layer_map.get(src, None)
-        tgt_layer = layer_map.get(tgt, None)
+        # plain indexing is safe: layer_map holds every known node id
+        src_layer = layer_map[src]
+        tgt_layer = layer_map[tgt]
 
         # If we don't know layers for either end, preserve link as-is.
         if src_layer is None or tgt_layer is None:
-            new_links.append(dict(link))
+            new_links[idx] = link
+            idx += 1
             continue
 
         if tgt_layer == src_layer or abs(tgt_layer - src_layer) == 1:
             # adjacent layers (or same layer) — no splitting required
-            new_links.append(dict(link))
+            new_links[idx] = link
+            idx += 1
             continue
 
         # handle directionality: allow links only left-to-right splitting (if right-to-left, preserve as-is)
         # For Sankey we expect left-to-right (increasing layer index). If link is reversed, keep as-is
         if tgt_layer < src_layer:
             # optionally we could reverse; but preserve original for now
-            new_links.append(dict(link))
+            new_links[idx] = link
+            idx += 1
             continue
 
         # create chain: src -> D(k=src_layer+1) -> ... -> tgt
         prev = src
+        meta = link.meta
+
+        # single construction site for chain links keeps the loop body compact
+        # (and gives any future compiled rewrite one function to target)
+        def mk(src_id, tgt_id, _val=val, _meta=meta):
+            return _Link(source=src_id, target=tgt_id, value=_val, meta=_meta)
+
         # create dummy per intermediate layer
         for layer in range(src_layer + 1, tgt_layer):
             did = f"__dummy_l{src_layer}_{tgt_layer}_{next(dummy_counter)}"
-            dummy_node = {
-                "id": did,
-                "label": None,
-                "segment": layer,
-                "dummy": True,
-                "orig_link_index": li
-            }
-            new_nodes.append(dummy_node)
+            dummy_nodes_append(_Node(id=did, segment=layer, dummy=True, orig_link_index=li))
             # create link prev -> did
-            new_links.append({
-                "source": prev,
-                "target": did,
-                "value": val,
-                # carry original metadata if present
-                **({k: v for k, v in link.items() if k not in ('source', 'target', 'value')})
-            })
+            new_links[idx] = mk(prev, did)
+            idx += 1
             prev = did
         # final connector prev -> tgt
-        new_links.append({
-            "source": prev,
-            "target": tgt,
-            "value": val,
-            **({k: v for k, v in link.items() if k not in ('source', 'target', 'value')})
-        })
-
-    return new_nodes, new_links
\ No newline at end of file
+        new_links[idx] = mk(prev, tgt)
+        idx += 1
+
+    # convert back to dicts at the boundary
+    new_nodes = list(nodes)
+    new_nodes.extend(d.to_dict() for d in dummy_nodes)
+    return new_nodes, [l.to_dict() for l in new_links[:idx]]
@@ -11,30 +11,130 @@ and which are stacked inside nodes to prevent overlap.
 Link width scaling may be controlled by `link_width_factor` (0..1) so the
 sum of link widths per node becomes a fraction of the node height.
 """
+from dataclasses import dataclass
 from typing import List, Dict, Optional, Tuple
 import json
 import math
-from collections import defaultdict, deque
+from collections import defaultdict
+
+import numpy as np
 
 # import the helper we added earlier
 from sankey_multi import split_long_links
 
 
+@dataclass
+class GraphIndex:
+    """Shared per-run lookup structures for one node/link list.
+
+    Every pipeline stage used to rebuild its own {id: node} map and
+    predecessor/successor adjacency from the same inputs; building this once
+    (right after link splitting) and threading it through removes that
+    repeated O(V+E) work. The stages keep optional graph arguments so they
+    still work standalone.
+    """
+    node_map: Dict[str, Dict]
+    id_to_idx: Dict[str, int]
+    preds: Dict[str, List[str]]
+    succs: Dict[str, List[str]]
+    out_links: Dict[str, List[int]]  # link indices grouped by source id
+    in_links: Dict[str, List[int]]   # link indices grouped by target id
+    src: np.ndarray                  # per-link source index (-1 == unknown node)
+    tgt: np.ndarray                  # per-link target index (-1 == unknown node)
+    val: np.ndarray                  # per-link value
+    # CSR adjacency over the known endpoints: iterating a node's neighbors is
+    # a contiguous array slice instead of chasing per-node list objects
+    out_indptr: np.ndarray
+    out_neighbors: np.ndarray        # target index per out-edge, grouped by source
+    in_indptr: np.ndarray
+    in_neighbors: np.ndarray         # source index per in-edge, grouped by target
+
+    def out_slice(self, i: int) -> np.ndarray:
+        return self.out_neighbors[self.out_indptr[i]:self.out_indptr[i + 1]]
+
+    def in_slice(self, i: int) -> np.ndarray:
+        return self.in_neighbors[self.in_indptr[i]:self.in_indptr[i + 1]]
+
+
+def build_graph_index(nodes: List[Dict], links: List[Dict]) -> GraphIndex:
+    """Build the shared GraphIndex in a single pass over nodes and links."""
+    node_map = {n['id']: n for n in nodes}
+    id_to_idx = {nid: i for i, nid in enumerate(node_map)}
+    preds = defaultdict(list)
+    succs = defaultdict(list)
+    out_links = defaultdict(list)
+    in_links = defaultdict(list)
+    m = len(links)
+    src = np.empty(m, dtype=np.int64)
+    tgt = np.empty(m, dtype=np.int64)
+    val = np.empty(m, dtype=np.float64)
+    get_idx = id_to_idx.get
+    for i, l in enumerate(links):
+        s = l['source']
+        t = l['target']
+        preds[t].append(s)
+        succs[s].append(t)
+        out_links[s].append(i)
+        in_links[t].append(i)
+        src[i] = get_idx(s, -1)
+        tgt[i] = get_idx(t, -1)
+        val[i] = l.get('value', 0.0)
+    # pack the known-endpoint edges to CSR form: sort by source (stable, so
+    # per-node edge order is preserved) and take cumulative counts as offsets
+    n = len(node_map)
+    known = (src >= 0) & (tgt >= 0)
+    ksrc = src[known]
+    ktgt = tgt[known]
+    out_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ksrc, minlength=n), out=out_indptr[1:])
+    out_neighbors = ktgt[np.argsort(ksrc, kind='stable')]
+    in_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ktgt, minlength=n), out=in_indptr[1:])
+    in_neighbors = ksrc[np.argsort(ktgt, kind='stable')]
+    return GraphIndex(node_map=node_map, id_to_idx=id_to_idx,
+                      preds=preds, succs=succs,
+                      out_links=out_links, in_links=in_links,
+                      src=src, tgt=tgt, val=val,
+                      out_indptr=out_indptr, out_neighbors=out_neighbors,
+                      in_indptr=in_indptr, in_neighbors=in_neighbors)
+
+
+# Optional numba kernel for the barycenter weights: past a few thousand
+# nodes per layer a JITed loop over the CSR arrays beats the numpy
+# gather/reduceat path (no temporary flat index array). The dependency
+# stays optional; without it every layer takes the numpy path.
+try:
+    from numba import njit
+
+    @njit(cache=True)
+    def _barycenter_weights(layer_nodes, indptr, neighbors, pos_of):
+        weights = np.empty(layer_nodes.size)
+        for i in range(layer_nodes.size):
+            u = layer_nodes[i]
+            s = 0.0
+            c = 0
+            for j in range(indptr[u], indptr[u + 1]):
+                s += pos_of[neighbors[j]]
+                c += 1
+            weights[i] = s / c if c else np.inf
+        return weights
+
+    _HAVE_BARYCENTER_KERNEL = True
+except ImportError:
+    _HAVE_BARYCENTER_KERNEL = False
+
+# layers smaller than this aren't worth the JIT dispatch overhead
+_KERNEL_MIN_LAYER = 512
+
+
 def load_input(path: str) -> Tuple[List[Dict], List[Dict], Optional[List[str]]]:
     with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     # support legacy two-column format
     if 'sources' in data and 'targets' in data and 'links' in data:
         segments = ["left", "right"]
-        nodes = []
-        for s in data['sources']:
-            node = dict(s)
-            node.setdefault('segment', 0)
-            nodes.append(node)
-        for t in data['targets']:
-            node = dict(t)
-            node.setdefault('segment', 1)
-            nodes.append(node)
+        nodes = ([{**s, 'segment': s.get('segment', 0)} for s in data['sources']]
+                 + [{**t, 'segment': t.get('segment', 1)} for t in data['targets']])
         links = data['links']
         return nodes, links, segments
 
@@ -48,66 +148,78 @@ def infer_layers(nodes: List[Dict], links: List[Dict], segments: Optional[List[s
     node_map = {n['id']: n for n in nodes}
     layer_map: Dict[str, Optional[int]] = {}
 
-    # first pass: use explicit segment if present
+    # first pass: use explicit segment if present, counting the unresolved
+    # entries as we go so the common all-segments-given case returns without
+    # a second scan or any topo structures being allocated
+    missing = 0
     for n in nodes:
         seg = n.get('segment', None)
-        if seg is None:
-            layer_map[n['id']] = None
-        else:
-            if isinstance(seg, int):
-                layer_map[n['id']] = seg
-            elif isinstance(seg, str) and segments is not None:
-                try:
-                    layer_map[n['id']] = segments.index(seg)
-                except ValueError:
-                    layer_map[n['id']] = None
-            else:
-                layer_map[n['id']] = None
-
-    if all(v is not None for v in layer_map.values()):
+        resolved = None
+        if isinstance(seg, int):
+            resolved = seg
+        elif isinstance(seg, str) and segments is not None:
+            try:
+                resolved = segments.index(seg)
+            except ValueError:
+                resolved = None
+        layer_map[n['id']] = resolved
+        if resolved is None:
+            missing += 1
+
+    if missing == 0:
         return {k: int(v) for k, v in layer_map.items()}
 
-    # build adjacency and indegree for topo
-    adj = defaultdict(list)
-    indeg = defaultdict(int)
+    # Kahn's algorithm on integer ids: indegrees from one bincount, CSR
+    # out-adjacency so expanding a node is an array slice, and layers kept
+    # in a flat int array rather than a dict keyed by node id
     nodes_ids = list(node_map.keys())
+    id_to_idx = {nid: i for i, nid in enumerate(nodes_ids)}
+    n = len(nodes_ids)
+    layer = np.full(n, -1, dtype=np.int64)  # -1 == unknown
+    for i, nid in enumerate(nodes_ids):
+        known = layer_map[nid]
+        if known is not None:
+            layer[i] = known
+
+    get_idx = id_to_idx.get
+    src = np.empty(len(links), dtype=np.int64)
+    tgt = np.empty(len(links), dtype=np.int64)
+    m = 0
     for l in links:
-        s = l['source']
-        t = l['target']
-        if s in node_map and t in node_map:
-            adj[s].append(t)
-            indeg[t] += 1
-            indeg.setdefault(s, indeg.get(s, 0))
-
-    q = deque()
-    for nid in nodes_ids:
-        if indeg.get(nid, 0) == 0:
-            q.append(nid)
-            if layer_map[nid] is None:
-                layer_map[nid] = 0
-
-    while q:
-        u = q.popleft()
-        u_layer = layer_map.get(u, 0) or 0
-        for v in adj[u]:
-            cur = layer_map.get(v)
-            candidate = u_layer + 1
-            if cur is None or candidate > cur:
-                layer_map[v] = candidate
+        si = get_idx(l['source'])
+        ti = get_idx(l['target'])
+        if si is not None and ti is not None:
+            src[m] = si
+            tgt[m] = ti
+            m += 1
+    src = src[:m]
+    tgt = tgt[:m]
+    indeg = np.bincount(tgt, minlength=n)
+    succ_off = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=succ_off[1:])
+    succ_nbr = tgt[np.argsort(src, kind='stable')]
+
+    q = np.where(indeg == 0)[0].tolist()
+    layer[[i for i in q if layer[i] < 0]] = 0
+
+    head = 0
+    while head < len(q):
+        u = q[head]
+        head += 1
+        candidate = max(layer[u], 0) + 1
+        for v in succ_nbr[succ_off[u]:succ_off[u + 1]]:
+            if candidate > layer[v]:
+                layer[v] = candidate
             indeg[v] -= 1
             if indeg[v] == 0:
                 q.append(v)
 
-    for k in list(layer_map.keys()):
-        if layer_map[k] is None:
-            layer_map[k] = 0
-
-    min_layer = min(layer_map.values()) if layer_map else 0
-    if min_layer != 0:
-        for k in layer_map:
-            layer_map[k] -= min_layer
+    # remaining unknowns default to 0, then shift so the smallest layer is 0
+    layer[layer < 0] = 0
+    if n:
+        layer -= layer.min()
 
-    return {k: int(v) for k, v in layer_map.items()}
+    return {nid: int(layer[i]) for i, nid in enumerate(nodes_ids)}
 
 
 def build_internal_graph(nodes: List[Dict], links: List[Dict], segments: Optional[List[str]] = None) -> Tuple[List[Dict], List[Dict], Dict[str, int]]:
@@ -125,17 +237,26 @@ def build_internal_graph(nodes: List[Dict], links: List[Dict], segments: Optiona
     return new_nodes, new_links, final_layer_map
 
 
-def compute_node_values(nodes: List[Dict], links: List[Dict]) -> Dict[str, float]:
-    in_sum = defaultdict(float)
-    out_sum = defaultdict(float)
-    for l in links:
-        out_sum[l['source']] += l.get('value', 0)
-        in_sum[l['target']] += l.get('value', 0)
-    vals = {}
-    for n in nodes:
-        nid = n['id']
-        vals[nid] = max(in_sum.get(nid, 0.0), out_sum.get(nid, 0.0), n.get('value', 0.0))
-    return vals
+def compute_node_values(nodes: List[Dict], links: List[Dict],
+                        graph: Optional[GraphIndex] = None) -> Dict[str, float]:
+    # accumulate per-node in/out sums with two weighted bincounts over the
+    # integer-encoded edge arrays instead of a Python dict update per link
+    n = len(nodes)
+    m = len(links)
+    if graph is not None:
+        src, tgt, lvals = graph.src, graph.tgt, graph.val
+    else:
+        id_to_idx = {nd['id']: i for i, nd in enumerate(nodes)}
+        src = np.fromiter((id_to_idx.get(l['source'], -1) for l in links), dtype=np.int64, count=m)
+        tgt = np.fromiter((id_to_idx.get(l['target'], -1) for l in links), dtype=np.int64, count=m)
+        lvals = np.fromiter((l.get('value', 0.0) for l in links), dtype=np.float64, count=m)
+    src_ok = src >= 0
+    tgt_ok = tgt >= 0
+    out_sum = np.bincount(src[src_ok], weights=lvals[src_ok], minlength=n)
+    in_sum = np.bincount(tgt[tgt_ok], weights=lvals[tgt_ok], minlength=n)
+    explicit = np.fromiter((nd.get('value', 0.0) for nd in nodes), dtype=np.float64, count=n)
+    node_vals = np.maximum(np.maximum(in_sum, out_sum), explicit)
+    return {nd['id']: float(v) for nd, v in zip(nodes, node_vals)}
 
 
 def group_by_layer(nodes: List[Dict], layer_map: Dict[str, int]) -> Dict[int, List[Dict]]:
@@ -148,39 +269,85 @@ def group_by_layer(nodes: List[Dict], layer_map: Dict[str, int]) -> Dict[int, Li
     return dict(layers)
 
 
-def barycenter_ordering(layers: Dict[int, List[Dict]], links: List[Dict], iterations: int = 1) -> Dict[int, List[str]]:
-    preds = defaultdict(list)
-    succs = defaultdict(list)
-    for l in links:
-        preds[l['target']].append(l['source'])
-        succs[l['source']].append(l['target'])
-
+def barycenter_ordering(layers: Dict[int, List[Dict]], links: List[Dict], iterations: int = 1,
+                        graph: Optional[GraphIndex] = None,
+                        sort_nodes: bool = True) -> Dict[int, List[str]]:
     order = {layer: [n['id'] for n in nodes] for layer, nodes in layers.items()}
 
+    # input order requested (or zero iterations): skip building any adjacency
+    # or position structures and return the layers as-is
+    if not sort_nodes or iterations <= 0:
+        return order
+
+    # in-layer position of every node: one lookup per neighbor instead of
+    # scanning each layer list with .index (which made a pass quadratic).
+    # With a GraphIndex the positions live in a flat array indexed by integer
+    # node id and neighbors come from contiguous CSR slices.
+    if graph is not None:
+        id_to_idx = graph.id_to_idx
+        pos_of = np.zeros(len(graph.node_map), dtype=np.int64)
+        for lst in order.values():
+            for i, nid in enumerate(lst):
+                pos_of[id_to_idx[nid]] = i
+    else:
+        pos_index = {nid: i for lst in order.values() for i, nid in enumerate(lst)}
+        # every node sits in exactly one layer, so after dropping neighbors
+        # that never got a position the inner loop can index pos_index
+        # unconditionally instead of re-checking membership per neighbor
+        preds = defaultdict(list)
+        succs = defaultdict(list)
+        for l in links:
+            s = l['source']
+            t = l['target']
+            if s in pos_index and t in pos_index:
+                preds[t].append(s)
+                succs[s].append(t)
+
     def barycenter(layer_idx: int, upward: bool):
         ids = order[layer_idx]
-        weights = {}
-        for nid in ids:
+        if graph is not None:
+            # whole-layer barycenters in one shot: gather every neighbor
+            # position into a flat array and segment-sum it with reduceat,
+            # so no Python loop runs per node
+            indptr, neighbors = ((graph.in_indptr, graph.in_neighbors) if upward
+                                 else (graph.out_indptr, graph.out_neighbors))
+            layer_nodes = np.fromiter((id_to_idx[nid] for nid in ids),
+                                      dtype=np.int64, count=len(ids))
+            # +inf marks nodes without neighbors: a stable argsort then keeps
+            # them after the weighted nodes, in their original relative order
+            if _HAVE_BARYCENTER_KERNEL and len(ids) >= _KERNEL_MIN_LAYER:
+                weights = _barycenter_weights(layer_nodes, indptr, neighbors, pos_of)
+            else:
+                starts = indptr[layer_nodes]
+                counts = indptr[layer_nodes + 1] - starts
+                weights = np.full(len(ids), np.inf)
+                nz = counts > 0
+                if nz.any():
+                    cnz = counts[nz]
+                    bnd = np.cumsum(cnz) - cnz
+                    flat = np.repeat(starts[nz] - bnd, cnz) + np.arange(cnz.sum())
+                    sums = np.add.reduceat(pos_of[neighbors[flat]], bnd)
+                    weights[nz] = sums / cnz
+            new_order = [ids[i] for i in np.argsort(weights, kind='stable')]
+            order[layer_idx] = new_order
+            for i, nid in enumerate(new_order):
+                pos_of[id_to_idx[nid]] = i
+            return
+        # same +inf sentinel and stable argsort as the graph path: native
+        # sorting instead of N log N Python-level key-lambda calls, with
+        # neighbor-less nodes kept after the weighted ones in input order
+        weights = np.full(len(ids), np.inf)
+        for i, nid in enumerate(ids):
             neighbors = preds[nid] if upward else succs[nid]
-            if not neighbors:
-                weights[nid] = None
-                continue
-            s = 0.0
-            c = 0
-            for nb in neighbors:
-                for lidx, lst in order.items():
-                    if nb in lst:
-                        pos = lst.index(nb)
-                        s += pos
-                        c += 1
-                        break
-            weights[nid] = (s / c) if c else None
-        with_b = [(nid, weights[nid]) for nid in ids]
-        has = [x for x in with_b if x[1] is not None]
-        nothas = [x for x in with_b if x[1] is None]
-        has.sort(key=lambda x: x[1])
-        new_order = [x[0] for x in has] + [x[0] for x in nothas]
+            if neighbors:
+                s = 0.0
+                for nb in neighbors:
+                    s += pos_index[nb]
+                weights[i] = s / len(neighbors)
+        new_order = [ids[i] for i in np.argsort(weights, kind='stable')]
         order[layer_idx] = new_order
+        for i, nid in enumerate(new_order):
+            pos_index[nid] = i
 
     layer_indices = sorted(order.keys())
     for _ in range(iterations):
@@ -191,9 +358,18 @@ def barycenter_ordering(layers: Dict[int, List[Dict]], links: List[Dict], iterat
     return order
 
 
-def compute_positions(layers: Dict[int, List[Dict]], ordering: Dict[int, List[str]], node_values: Dict[str, float],
-                      width: int = 800, height: int = 600, node_width: int = 20, layer_padding: int = 100,
-                      node_padding: int = 8) -> Tuple[Dict[str, Tuple[float, float]], Dict[str, Tuple[float, float]]]:
+def compute_positions_arrays(layers: Dict[int, List[Dict]], ordering: Dict[int, List[str]],
+                             node_values: Dict[str, float], id_to_idx: Dict[str, int],
+                             width: int = 800, height: int = 600, node_width: int = 20,
+                             layer_padding: int = 100, node_padding: int = 8
+                             ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Structure-of-arrays layout: xs/ys/widths/heights indexed by the integer
+    node id from id_to_idx (nan where a node never got a position).
+
+    Downstream consumers can index these arrays directly instead of paying a
+    dict lookup and tuple unpack per node access; compute_positions wraps this
+    for the dict-shaped public API.
+    """
     num_layers = max(layers.keys()) + 1 if layers else 1
     total_width = width - 40
     if num_layers > 1:
@@ -201,23 +377,56 @@ def compute_positions(layers: Dict[int, List[Dict]], ordering: Dict[int, List[st
     else:
         layer_xs = {0: width / 2}
 
-    positions = {}
-    sizes = {}
+    n = len(id_to_idx)
+    xs = np.full(n, np.nan)
+    ys = np.full(n, np.nan)
+    widths = np.full(n, float(node_width))
+    heights = np.full(n, np.nan)
 
     for li, nodes_in_layer in layers.items():
         ordered_ids = ordering.get(li, [n['id'] for n in nodes_in_layer])
-        vals = [node_values.get(nid, 1.0) for nid in ordered_ids]
-        total_val = sum(vals) if vals else 1.0
+        if not ordered_ids:
+            continue
+        vals = np.fromiter((node_values.get(nid, 1.0) for nid in ordered_ids),
+                           dtype=np.float64, count=len(ordered_ids))
+        total_val = vals.sum() or 1.0
         avail_height = height - 40
         min_node_h = 6
-        raw_heights = [max(min_node_h, (v / total_val) * (avail_height * 0.6)) for v in vals]
-        y = 20
-        for nid, h in zip(ordered_ids, raw_heights):
-            x = layer_xs.get(li, 20)
-            positions[nid] = (x, y + h / 2)
-            sizes[nid] = (node_width, h)
-            y += h + node_padding
+        # heights and stacked y-centers from whole-array arithmetic plus one
+        # cumsum, instead of a running Python total per node
+        raw_heights = np.maximum(min_node_h, (vals / total_val) * (avail_height * 0.6))
+        steps = raw_heights + node_padding
+        tops = 20 + np.cumsum(steps) - steps
+        centers_y = tops + raw_heights / 2
+        x = layer_xs.get(li, 20)
+        for nid, cy, h in zip(ordered_ids, centers_y, raw_heights):
+            j = id_to_idx.get(nid)
+            if j is not None:
+                xs[j] = x
+                ys[j] = cy
+                heights[j] = h
+
+    return xs, ys, widths, heights
+
+
+def compute_positions(layers: Dict[int, List[Dict]], ordering: Dict[int, List[str]], node_values: Dict[str, float],
+                      width: int = 800, height: int = 600, node_width: int = 20, layer_padding: int = 100,
+                      node_padding: int = 8) -> Tuple[Dict[str, Tuple[float, float]], Dict[str, Tuple[float, float]]]:
+    # number nodes in the same order the dicts used to be filled so the
+    # public return (and everything formatted from it) is unchanged
+    id_to_idx: Dict[str, int] = {}
+    for li, nodes_in_layer in layers.items():
+        for nid in ordering.get(li, [n['id'] for n in nodes_in_layer]):
+            if nid not in id_to_idx:
+                id_to_idx[nid] = len(id_to_idx)
+
+    xs, ys, widths, heights = compute_positions_arrays(
+        layers, ordering, node_values, id_to_idx,
+        width=width, height=height, node_width=node_width,
+        layer_padding=layer_padding, node_padding=node_padding)
 
+    positions = {nid: (float(xs[j]), float(ys[j])) for nid, j in id_to_idx.items()}
+    sizes = {nid: (float(widths[j]), float(heights[j])) for nid, j in id_to_idx.items()}
     return positions, sizes
 
 
@@ -226,7 +435,8 @@ def compute_positions(layers: Dict[int, List[Dict]], ordering: Dict[int, List[st
 # --------------------------
 
 def _compute_link_thicknesses(links: List[Dict], sizes: Dict[str, Tuple[float, float]], factor: float = 1.0,
-                              min_thickness: float = 1.0) -> Dict[int, float]:
+                              min_thickness: float = 1.0,
+                              graph: Optional[GraphIndex] = None) -> Dict[int, float]:
     """
     Compute a pixel thickness for each link (keyed by link index) such that link thicknesses
     are proportional to link values and the sum of thicknesses per node is approximately
@@ -243,178 +453,187 @@ def _compute_link_thicknesses(links: List[Dict], sizes: Dict[str, Tuple[float, f
     """
     if not links:
         return {}
-    # compute per-node sums
-    sum_out = defaultdict(float)
-    sum_in = defaultdict(float)
-    for l in links:
-        v = l.get('value', 0.0)
-        sum_out[l['source']] += v
-        sum_in[l['target']] += v
-
-    # per-node scales
-    scale_out = {}
-    scale_in = {}
-    for nid, (w, h) in sizes.items():
-        # node height in pixels
-        node_h = h
-        so = sum_out.get(nid, 0.0)
-        si = sum_in.get(nid, 0.0)
-        if so > 0:
-            scale_out[nid] = (node_h * factor) / so
-        if si > 0:
-            scale_in[nid] = (node_h * factor) / si
+    m = len(links)
+    if graph is not None:
+        # reuse the shared encoding; nodes the layout never sized get a nan
+        # height so they fall through to the global-fallback scale below
+        n = len(graph.node_map)
+        src, tgt, lvals = graph.src, graph.tgt, graph.val
+        heights = np.fromiter(
+            (sizes[nid][1] if nid in sizes else np.nan for nid in graph.node_map),
+            dtype=np.float64, count=n)
+    else:
+        # integer-encode link endpoints against the sized nodes (-1 == unknown)
+        id_to_idx = {nid: i for i, nid in enumerate(sizes)}
+        n = len(sizes)
+        src = np.fromiter((id_to_idx.get(l['source'], -1) for l in links), dtype=np.int64, count=m)
+        tgt = np.fromiter((id_to_idx.get(l['target'], -1) for l in links), dtype=np.int64, count=m)
+        lvals = np.fromiter((l.get('value', 0.0) for l in links), dtype=np.float64, count=m)
+        heights = np.fromiter((h for (w, h) in sizes.values()), dtype=np.float64, count=n)
+
+    # per-node sums and scales as whole arrays: two weighted bincounts plus
+    # vectorized division, nan marking sides without flow
+    src_ok = src >= 0
+    tgt_ok = tgt >= 0
+    sum_out = np.bincount(src[src_ok], weights=lvals[src_ok], minlength=n)
+    sum_in = np.bincount(tgt[tgt_ok], weights=lvals[tgt_ok], minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale_out = np.where(sum_out > 0, (heights * factor) / sum_out, np.nan)
+        scale_in = np.where(sum_in > 0, (heights * factor) / sum_in, np.nan)
 
     # fallback global scale if neither side available for a link
-    # use a conservative small scale relative to median node height
-    median_h = 40.0
-    try:
-        median_h = sorted([h for (w, h) in sizes.values()])[len(sizes)//2]
-    except Exception:
-        pass
-    default_scale = (median_h * factor) / max(1.0, max((l.get('value', 0.0) for l in links), default=1.0))
-
-    thickness = {}
-    for i, l in enumerate(links):
-        v = l.get('value', 0.0)
-        s_src = scale_out.get(l['source'])
-        s_tgt = scale_in.get(l['target'])
-        if s_src is not None and s_tgt is not None:
-            s = (s_src + s_tgt) / 2.0
-        elif s_src is not None:
-            s = s_src
-        elif s_tgt is not None:
-            s = s_tgt
-        else:
-            s = default_scale
-        t = max(min_thickness, v * s)
-        thickness[i] = t
-    return thickness
+    # use a conservative small scale relative to median node height;
+    # np.median selects in O(N) instead of sorting the heights every call
+    if sizes:
+        median_h = float(np.median(np.fromiter((h for (w, h) in sizes.values()),
+                                               dtype=np.float64, count=len(sizes))))
+    else:
+        median_h = 40.0
+    default_scale = (median_h * factor) / max(1.0, lvals.max() if m else 1.0)
+
+    # per-link scale: average when both sides exist, one side when only one
+    # does, global fallback otherwise (nan-aware without a Python branch per link)
+    s_src = np.where(src_ok, scale_out[np.where(src_ok, src, 0)], np.nan)
+    s_tgt = np.where(tgt_ok, scale_in[np.where(tgt_ok, tgt, 0)], np.nan)
+    has_src = ~np.isnan(s_src)
+    has_tgt = ~np.isnan(s_tgt)
+    s = np.where(has_src & has_tgt, (s_src + s_tgt) / 2.0,
+                 np.where(has_src, s_src,
+                          np.where(has_tgt, s_tgt, default_scale)))
+    thickness = np.maximum(min_thickness, lvals * s)
+    return {i: float(t) for i, t in enumerate(thickness)}
 
 
 def _stack_links_by_node(links: List[Dict], positions: Dict[str, Tuple[float, float]], sizes: Dict[str, Tuple[float, float]],
-                         thickness_map: Dict[int, float], center_stacks: bool = True) -> Dict[int, Dict[str, float]]:
-    out_lists = defaultdict(list)
-    in_lists = defaultdict(list)
-    for idx, l in enumerate(links):
-        out_lists[l['source']].append(idx)
-        in_lists[l['target']].append(idx)
+                         thickness_map: Dict[int, float], center_stacks: bool = True,
+                         graph: Optional[GraphIndex] = None) -> Dict[int, Dict[str, float]]:
+    if graph is not None:
+        out_lists, in_lists = graph.out_links, graph.in_links
+    else:
+        out_lists = defaultdict(list)
+        in_lists = defaultdict(list)
+        for idx, l in enumerate(links):
+            out_lists[l['source']].append(idx)
+            in_lists[l['target']].append(idx)
 
     link_positions = {}
-    # outgoing stacks
-    for nid, idxs in out_lists.items():
-        if nid not in positions or nid not in sizes:
-            continue
-        x, yc = positions[nid]
-        w, h = sizes[nid]
-        top = yc - h / 2
-        # compute total thickness for this node's outgoing links
-        total_t = sum(thickness_map.get(idx, 0.0) for idx in idxs)
-        cur = top
-        if center_stacks and total_t < h:
-            cur = top + (h - total_t) / 2.0
-        for idx in idxs:
-            t = thickness_map.get(idx, 1.0)
-            s_top = cur
-            s_bot = cur + t
-            if idx not in link_positions:
-                link_positions[idx] = {}
-            link_positions[idx]['s_top'] = s_top
-            link_positions[idx]['s_bot'] = s_bot
-            link_positions[idx]['thickness'] = t
-            cur = s_bot
-    # incoming stacks
-    for nid, idxs in in_lists.items():
-        if nid not in positions or nid not in sizes:
-            continue
-        x, yc = positions[nid]
-        w, h = sizes[nid]
-        top = yc - h / 2
-        total_t = sum(thickness_map.get(idx, 0.0) for idx in idxs)
-        cur = top
-        if center_stacks and total_t < h:
-            cur = top + (h - total_t) / 2.0
-        for idx in idxs:
-            t = thickness_map.get(idx, 1.0)
-            t_top = cur
-            t_bot = cur + t
-            if idx not in link_positions:
-                link_positions[idx] = {}
-            link_positions[idx]['t_top'] = t_top
-            link_positions[idx]['t_bot'] = t_bot
-            link_positions[idx]['thickness'] = t
-            cur = t_bot
+    thickness_get = thickness_map.get
+
+    # one stacking routine parameterized by side: the outgoing and incoming
+    # passes were copy-pasted loops differing only in which keys they wrote
+    def stack(lists_by_node, top_key, bot_key):
+        for nid, idxs in lists_by_node.items():
+            if nid not in positions or nid not in sizes:
+                continue
+            x, yc = positions[nid]
+            w, h = sizes[nid]
+            top = yc - h / 2
+            # total stacked thickness at this node, for optional centering
+            total_t = sum(thickness_get(idx, 0.0) for idx in idxs)
+            cur = top
+            if center_stacks and total_t < h:
+                cur = top + (h - total_t) / 2.0
+            for idx in idxs:
+                t = thickness_get(idx, 1.0)
+                lp = link_positions.setdefault(idx, {})
+                lp[top_key] = cur
+                lp[bot_key] = cur + t
+                lp['thickness'] = t
+                cur += t
+
+    stack(out_lists, 's_top', 's_bot')
+    stack(in_lists, 't_top', 't_bot')
     return link_positions
 
 
+# single-pass XML escaping: translate walks the string once against a
+# prebuilt table instead of three chained .replace passes
+_ESC_TBL = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def _esc(s: str) -> str:
+    return s.translate(_ESC_TBL) if s else ''
+
+
+# SVG element templates: %-formatting with a tuple runs one C-level format
+# call per element instead of one FORMAT_VALUE per interpolated float
+_RIBBON_FMT = ('<path d="M %.2f,%.2f C %.2f,%.2f %.2f,%.2f %.2f,%.2f'
+               ' L %.2f,%.2f C %.2f,%.2f %.2f,%.2f %.2f,%.2f Z"'
+               ' fill="#dcdcdc" stroke="none" opacity="0.9"/>\n')
+_FALLBACK_LINK_FMT = ('<path d="M %.2f,%.2f C %.2f,%.2f %.2f,%.2f %.2f,%.2f" class="link"'
+                      ' stroke="#888" stroke-width="%.2f" fill="none" stroke-opacity="0.8" />\n')
+_RECT_FMT = '<rect x="%.2f" y="%.2f" width="%.2f" height="%.2f" class="node"/>\n'
+_DUMMY_RECT_FMT = '<rect x="%.2f" y="%.2f" width="%.2f" height="%.2f" fill="#ccc" stroke="#666" stroke-dasharray="2,2"/>\n'
+_LABEL_FMT = '<text x="%.2f" y="%.2f" class="label">%s</text>\n'
+
+
 def render_svg(nodes: List[Dict], links: List[Dict], positions: Dict[str, Tuple[float, float]], sizes: Dict[str, Tuple[float, float]],
                layer_map: Dict[str, int], filename: str = 'output.svg', width: int = 800, height: int = 600,
-               link_width_factor: float = 1.0):
-    def esc(s: str) -> str:
-        return (s.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;') if s else '')
+               link_width_factor: float = 1.0, graph: Optional[GraphIndex] = None):
+    esc = _esc
 
-    node_by_id = {n['id']: n for n in nodes}
+    node_by_id = graph.node_map if graph is not None else {n['id']: n for n in nodes}
 
     # compute thickness map using sizes and factor
-    thickness_map = _compute_link_thicknesses(links, sizes, factor=link_width_factor)
-    link_pos_map = _stack_links_by_node(links, positions, sizes, thickness_map)
-
-    svg = []
-    svg.append(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">')
-    svg.append('<style> .node {fill:#1f77b4; stroke:#000; stroke-width:0.5;} .label{font:12px sans-serif; fill:#000;} .link{fill-opacity:0.6; stroke:none;} </style>')
+    thickness_map = _compute_link_thicknesses(links, sizes, factor=link_width_factor, graph=graph)
+    link_pos_map = _stack_links_by_node(links, positions, sizes, thickness_map, graph=graph)
+
+    # stream straight into a buffered file handle: no output list, no final
+    # '\n'.join doubling peak memory on large diagrams
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        write = f.write
+        write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n')
+        write('<style> .node {fill:#1f77b4; stroke:#000; stroke-width:0.5;} .label{font:12px sans-serif; fill:#000;} .link{fill-opacity:0.6; stroke:none;} </style>\n')
+
+        # draw links first so nodes are on top
+        for i, l in enumerate(links):
+            s = l['source']
+            t = l['target']
+            if s not in positions or t not in positions:
+                continue
+            lp = link_pos_map.get(i)
+            if not lp or 's_top' not in lp or 't_top' not in lp:
+                x1, y1 = positions[s]
+                x2, y2 = positions[t]
+                start_x = x1 + sizes.get(s, (10,10))[0]/2
+                end_x = x2 - sizes.get(t,(10,10))[0]/2
+                stroke_w = thickness_map.get(i, 1.0)
+                dx = (end_x - start_x) * 0.3
+                write(_FALLBACK_LINK_FMT % (start_x, y1, start_x + dx, y1,
+                                            end_x - dx, y2, end_x, y2, stroke_w))
+                continue
 
-    # draw links first so nodes are on top
-    for i, l in enumerate(links):
-        s = l['source']
-        t = l['target']
-        if s not in positions or t not in positions:
-            continue
-        lp = link_pos_map.get(i)
-        if not lp or 's_top' not in lp or 't_top' not in lp:
-            x1, y1 = positions[s]
-            x2, y2 = positions[t]
-            start_x = x1 + sizes.get(s, (10,10))[0]/2
-            end_x = x2 - sizes.get(t,(10,10))[0]/2
-            stroke_w = thickness_map.get(i, 1.0)
-            path = f'M {start_x:.2f},{y1:.2f} C {start_x + (end_x-start_x)*0.3:.2f},{y1:.2f} {end_x - (end_x-start_x)*0.3:.2f},{y2:.2f} {end_x:.2f},{y2:.2f}'
-            svg.append(f'<path d="{path}" class="link" stroke="#888" stroke-width="{stroke_w:.2f}" fill="none" stroke-opacity="0.8" />')
-            continue
+            s_x, s_yc = positions[s]
+            t_x, t_yc = positions[t]
+            s_w, s_h = sizes.get(s, (10,10))
+            t_w, t_h = sizes.get(t, (10,10))
+
+            start_x = s_x + s_w/2 if (t_x >= s_x) else s_x - s_w/2
+            end_x = t_x - t_w/2 if (t_x >= s_x) else t_x + t_w/2
+
+            s_top = lp['s_top']
+            s_bot = lp['s_bot']
+            t_top = lp['t_top']
+            t_bot = lp['t_bot']
+
+            dx = (end_x - start_x) * 0.3
+            c1x = start_x + dx
+            c2x = end_x - dx
+
+            write(_RIBBON_FMT % (start_x, s_top, c1x, s_top, c2x, t_top, end_x, t_top,
+                                 end_x, t_bot, c2x, t_bot, c1x, s_bot, start_x, s_bot))
+
+        # draw nodes
+        for nid, (x, y) in positions.items():
+            w, h = sizes.get(nid, (10, 10))
+            rx = x - w/2
+            ry = y - h/2
+            node = node_by_id.get(nid, {})
+            if node.get('dummy'):
+                write(_DUMMY_RECT_FMT % (rx, ry, w, h))
+            else:
+                write(_RECT_FMT % (rx, ry, w, h))
+                label = node.get('label') or nid
+                write(_LABEL_FMT % (x + w / 2 + 6, y + 4, esc(label)))
 
-        s_x, s_yc = positions[s]
-        t_x, t_yc = positions[t]
-        s_w, s_h = sizes.get(s, (10,10))
-        t_w, t_h = sizes.get(t, (10,10))
-
-        start_x = s_x + s_w/2 if (t_x >= s_x) else s_x - s_w/2
-        end_x = t_x - t_w/2 if (t_x >= s_x) else t_x + t_w/2
-
-        s_top = lp['s_top']
-        s_bot = lp['s_bot']
-        t_top = lp['t_top']
-        t_bot = lp['t_bot']
-
-        dx = (end_x - start_x) * 0.3
-        c1x = start_x + dx
-        c2x = end_x - dx
-
-        top_path = f'M {start_x:.2f},{s_top:.2f} C {c1x:.2f},{s_top:.2f} {c2x:.2f},{t_top:.2f} {end_x:.2f},{t_top:.2f}'
-        bottom_path = f'L {end_x:.2f},{t_bot:.2f} C {c2x:.2f},{t_bot:.2f} {c1x:.2f},{s_bot:.2f} {start_x:.2f},{s_bot:.2f} Z'
-
-        svg.append(f'<path d="{top_path} {bottom_path}" fill="#dcdcdc" stroke="none" opacity="0.9"/>')
-
-    # draw nodes
-    for nid, (x, y) in positions.items():
-        w, h = sizes.get(nid, (10, 10))
-        rx = x - w/2
-        ry = y - h/2
-        node = node_by_id.get(nid, {})
-        if node.get('dummy'):
-            svg.append(f'<rect x="{rx:.2f}" y="{ry:.2f}" width="{w:.2f}" height="{h:.2f}" fill="#ccc" stroke="#666" stroke-dasharray="2,2"/>')
-        else:
-            svg.append(f'<rect x="{rx:.2f}" y="{ry:.2f}" width="{w:.2f}" height="{h:.2f}" class="node"/>')
-            label = node.get('label') or nid
-            svg.append(f'<text x="{x + w/2 + 6:.2f}" y="{y + 4:.2f}" class="label">{esc(label)}</text>')
-
-    svg.append('</svg>')
-
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(svg))
+        write('</svg>')
@@ -9,14 +9,124 @@ string directly so it works without adding libraries.
 """
 
 from typing import List, Dict, Optional, Tuple
+from functools import lru_cache
 import json
-import math
-from collections import defaultdict, deque
+import sys
+from collections import defaultdict
+
+import numpy as np
 
 # import the helper we added earlier
 from sankey_multi import split_long_links
 
 
+class AdjacencyIndex:
+    """CSR-style adjacency built once per pipeline run and shared by stages.
+
+    Nodes are numbered 0..n-1 in input order; forward and reverse edges are
+    stored as flat contiguous arrays (indptr/neighbors pairs) so iterating a
+    node's neighbors is an array slice instead of dict-of-list chasing.
+    """
+
+    def __init__(self, nodes: List[Dict], links: List[Dict]):
+        self.ids = [n['id'] for n in nodes]
+        self.id_to_idx = {nid: i for i, nid in enumerate(self.ids)}
+        self.n = len(self.ids)
+
+        m = len(links)
+        src = np.empty(m, dtype=np.int32)
+        tgt = np.empty(m, dtype=np.int32)
+        val = np.empty(m, dtype=np.float64)
+        get_idx = self.id_to_idx.get
+        for k, l in enumerate(links):
+            # -1 marks an endpoint that is not a known node; dangling links
+            # stay in the edge arrays (their known side still contributes to
+            # node values) but are left out of the CSR neighbor lists
+            src[k] = get_idx(l['source'], -1)
+            tgt[k] = get_idx(l['target'], -1)
+            val[k] = l.get('value', 0.0)
+        self.src = src
+        self.tgt = tgt
+        self.val = val
+
+        known = (src >= 0) & (tgt >= 0)
+        ksrc = src[known]
+        ktgt = tgt[known]
+
+        # forward (out) CSR: edges grouped by source
+        self.out_indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ksrc, minlength=self.n), out=self.out_indptr[1:])
+        self.out_neighbors = ktgt[np.argsort(ksrc, kind='stable')]
+
+        # reverse (in) CSR: edges grouped by target
+        self.in_indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ktgt, minlength=self.n), out=self.in_indptr[1:])
+        self.in_neighbors = ksrc[np.argsort(ktgt, kind='stable')]
+
+    def out_slice(self, i: int) -> np.ndarray:
+        return self.out_neighbors[self.out_indptr[i]:self.out_indptr[i + 1]]
+
+    def in_slice(self, i: int) -> np.ndarray:
+        return self.in_neighbors[self.in_indptr[i]:self.in_indptr[i + 1]]
+
+
+def build_csr(nodes: List[Dict], links: List[Dict]) -> AdjacencyIndex:
+    """Build the shared CSR adjacency for a node/link list."""
+    return AdjacencyIndex(nodes, links)
+
+
+# Optional numba kernel for the barycenter inner loop: on layers with
+# thousands of nodes the gather-and-average over CSR slices is a tight
+# numeric loop where interpreter overhead dominates. Small layers stay on
+# the numpy path to avoid paying JIT warmup for nothing.
+try:
+    from numba import njit
+
+    @njit(cache=True)
+    def _barycenter_weights(layer_nodes, indptr, neighbors, pos_of):
+        weights = np.empty(layer_nodes.size)
+        for i in range(layer_nodes.size):
+            u = layer_nodes[i]
+            s = 0.0
+            c = 0
+            for j in range(indptr[u], indptr[u + 1]):
+                s += pos_of[neighbors[j]]
+                c += 1
+            weights[i] = s / c if c else np.inf
+        return weights
+
+    _HAVE_BARYCENTER_KERNEL = True
+except ImportError:
+    _HAVE_BARYCENTER_KERNEL = False
+
+# below this layer size the JIT call is not worth its dispatch overhead
+_KERNEL_MIN_LAYER = 512
+
+
+@lru_cache(maxsize=None)
+def _esc(s: str) -> str:
+    """XML-escape a label; memoized since labels repeat across renders."""
+    return (s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if s else '')
+
+
+def _intern_graph(nodes: List[Dict], links: List[Dict]) -> None:
+    """Intern node id/source/target/segment strings in place.
+
+    Every pipeline stage keys dicts by these strings; interning lets those
+    lookups hit CPython's pointer-equality fast path instead of comparing
+    characters each time.
+    """
+    intern = sys.intern
+    for n in nodes:
+        n['id'] = intern(n['id'])
+        seg = n.get('segment')
+        if isinstance(seg, str):
+            n['segment'] = intern(seg)
+    for l in links:
+        l['source'] = intern(l['source'])
+        l['target'] = intern(l['target'])
+
+
 def load_input(path: str) -> Tuple[List[Dict], List[Dict], Optional[List[str]]]:
     with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -33,20 +143,25 @@ def load_input(path: str) -> Tuple[List[Dict], List[Dict], Optional[List[str]]]:
             node.setdefault('segment', 1)
             nodes.append(node)
         links = data['links']
+        _intern_graph(nodes, links)
         return nodes, links, segments
 
     nodes = data.get('nodes', [])
     links = data.get('links', [])
     segments = data.get('segments', None)
+    _intern_graph(nodes, links)
     return nodes, links, segments
 
 
-def infer_layers(nodes: List[Dict], links: List[Dict], segments: Optional[List[str]] = None) -> Dict[str, int]:
+def infer_layers(nodes: List[Dict], links: List[Dict], segments: Optional[List[str]] = None,
+                 node_by_id: Optional[Dict[str, Dict]] = None) -> Dict[str, int]:
     """Return a map node_id -> layer index.
     If nodes have explicit 'segment' use that (resolving names via segments list).
     Otherwise try to infer layers by topological layering (min distance from sources).
+
+    node_by_id is the shared id -> node map; when omitted it is built locally.
     """
-    node_map = {n['id']: n for n in nodes}
+    node_map = node_by_id if node_by_id is not None else {n['id']: n for n in nodes}
     layer_map: Dict[str, Optional[int]] = {}
 
     # first pass: use explicit segment if present
@@ -69,58 +184,82 @@ def infer_layers(nodes: List[Dict], links: List[Dict], segments: Optional[List[s
     if all(v is not None for v in layer_map.values()):
         return {k: int(v) for k, v in layer_map.items()}
 
-    # build adjacency and indegree for topo
-    adj = defaultdict(list)
-    indeg = defaultdict(int)
-    nodes_ids = list(node_map.keys())
+    # integer-indexed structures for the topological pass: a flat indegree
+    # array plus per-node out-edge lists replace the per-edge dict hashing
+    ids = list(node_map.keys())
+    id_to_idx = {nid: i for i, nid in enumerate(ids)}
+    n = len(ids)
+    layer = np.full(n, -1, dtype=np.int64)  # -1 == unknown
+    for i, nid in enumerate(ids):
+        known = layer_map[nid]
+        if known is not None:
+            layer[i] = known
+
+    # edges as flat integer arrays, packed to CSR form (same layout as
+    # AdjacencyIndex): neighbor iteration becomes a contiguous array slice
+    # instead of chasing per-node Python lists
+    get_idx = id_to_idx.get
+    src = np.empty(len(links), dtype=np.int64)
+    tgt = np.empty(len(links), dtype=np.int64)
+    m = 0
     for l in links:
-        s = l['source']
-        t = l['target']
-        if s in node_map and t in node_map:
-            adj[s].append(t)
-            indeg[t] += 1
-            indeg.setdefault(s, indeg.get(s, 0))
+        si = get_idx(l['source'])
+        ti = get_idx(l['target'])
+        if si is not None and ti is not None:
+            src[m] = si
+            tgt[m] = ti
+            m += 1
+    src = src[:m]
+    tgt = tgt[:m]
+    indeg = np.bincount(tgt, minlength=n).astype(np.int32)
+    out_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=out_indptr[1:])
+    out_neighbors = tgt[np.argsort(src, kind='stable')]
 
     # nodes with indeg 0 are sources — layer 0 (if not already set)
-    q = deque()
-    for nid in nodes_ids:
-        if indeg.get(nid, 0) == 0:
-            q.append(nid)
-            if layer_map[nid] is None:
-                layer_map[nid] = 0
-
-    # BFS-like propagation assigning layer = max(parent_layer)+1
-    while q:
-        u = q.popleft()
-        u_layer = layer_map.get(u, 0) or 0
-        for v in adj[u]:
-            # set tentative layer for v
-            cur = layer_map.get(v)
-            candidate = u_layer + 1
-            if cur is None or candidate > cur:
-                layer_map[v] = candidate
-            indeg[v] -= 1
-            if indeg[v] == 0:
-                q.append(v)
-
-    # fallback: any remaining None -> 0
-    for k in list(layer_map.keys()):
-        if layer_map[k] is None:
-            layer_map[k] = 0
-
-    # normalize so smallest layer is 0
-    min_layer = min(layer_map.values()) if layer_map else 0
-    if min_layer != 0:
-        for k in layer_map:
-            layer_map[k] -= min_layer
-
-    return {k: int(v) for k, v in layer_map.items()}
+    current = np.where(indeg == 0)[0]
+    layer[current[layer[current] < 0]] = 0
+
+    # level-synchronous propagation assigning layer = max(parent_layer)+1:
+    # each sweep consumes one whole frontier array and collects the next,
+    # so the traversal is sequential scans over flat arrays rather than
+    # one pointer-chasing pop per node
+    while current.size:
+        next_level = []
+        for u in current:
+            candidate = max(layer[u], 0) + 1
+            for v in out_neighbors[out_indptr[u]:out_indptr[u + 1]]:
+                if candidate > layer[v]:
+                    layer[v] = candidate
+                indeg[v] -= 1
+                if indeg[v] == 0:
+                    next_level.append(v)
+        current = np.asarray(next_level, dtype=np.int64)
+
+    # fallback: any remaining unknown -> 0, then normalize so smallest is 0
+    layer[layer < 0] = 0
+    if n:
+        layer -= layer.min()
+
+    return {nid: int(layer[i]) for i, nid in enumerate(ids)}
 
 
 def build_internal_graph(nodes: List[Dict], links: List[Dict], segments: Optional[List[str]] = None) -> Tuple[List[Dict], List[Dict], Dict[str, int]]:
     """Split long links and return augmented nodes/links and computed layer map."""
     # first get layer hints from nodes
     layer_map = infer_layers(nodes, links, segments)
+    # fast path: when no link spans more than one layer forward there is
+    # nothing to split, so skip the per-node dict copies and the
+    # split_long_links traversal entirely (reversed and same-layer links are
+    # preserved as-is by the splitter anyway)
+    get_layer = layer_map.get
+    needs_split = any(
+        (tl := get_layer(l['target'])) is not None
+        and (sl := get_layer(l['source'])) is not None
+        and tl - sl > 1
+        for l in links)
+    if not needs_split:
+        return nodes, links, dict(layer_map)
     # annotate nodes with resolved integer 'segment' for split_long_links
     nodes_copy = [dict(n) for n in nodes]
     for n in nodes_copy:
@@ -136,81 +275,127 @@ def build_internal_graph(nodes: List[Dict], links: List[Dict], segments: Optiona
     return new_nodes, new_links, final_layer_map
 
 
-def compute_node_values(nodes: List[Dict], links: List[Dict]) -> Dict[str, float]:
-    """Compute node total value = max(sum(in), sum(out)) as a layout heuristic."""
-    in_sum = defaultdict(float)
-    out_sum = defaultdict(float)
-    for l in links:
-        out_sum[l['source']] += l.get('value', 0)
-        in_sum[l['target']] += l.get('value', 0)
-    vals = {}
-    for n in nodes:
-        nid = n['id']
-        vals[nid] = max(in_sum.get(nid, 0.0), out_sum.get(nid, 0.0), n.get('value', 0.0))
-    return vals
+def compute_node_values(nodes: List[Dict], links: List[Dict],
+                        adj: Optional[AdjacencyIndex] = None) -> Dict[str, float]:
+    """Compute node total value = max(sum(in), sum(out)) as a layout heuristic.
 
-
-def group_by_layer(nodes: List[Dict], layer_map: Dict[str, int]) -> Dict[int, List[Dict]]:
+    The per-link accumulation runs as two vectorized bincounts over the
+    integer-encoded edge arrays instead of a Python dict loop per link.
+    """
+    if adj is None:
+        adj = build_csr(nodes, links)
+    # mask each side independently: a dangling link still contributes its
+    # flow to whichever endpoint is a known node
+    src_ok = adj.src >= 0
+    tgt_ok = adj.tgt >= 0
+    out_sum = np.bincount(adj.src[src_ok], weights=adj.val[src_ok], minlength=adj.n)
+    in_sum = np.bincount(adj.tgt[tgt_ok], weights=adj.val[tgt_ok], minlength=adj.n)
+    node_vals = np.maximum(out_sum, in_sum)
+    explicit = np.fromiter((n.get('value', 0.0) for n in nodes),
+                           dtype=np.float64, count=len(nodes))
+    node_vals = np.maximum(node_vals, explicit)
+    # dict only at the boundary
+    return {nid: float(v) for nid, v in zip(adj.ids, node_vals)}
+
+
+def group_by_layer_and_order(nodes: List[Dict], layer_map: Dict[str, int]
+                             ) -> Tuple[Dict[int, List[Dict]], Dict[int, List[str]]]:
+    """Bucket nodes by layer and build the initial per-layer id ordering in
+    one sweep, instead of grouping first and re-traversing for the ids."""
     layers = defaultdict(list)
+    order = defaultdict(list)
     for n in nodes:
         lid = layer_map.get(n['id'])
         if lid is None:
             lid = n.get('segment', 0)
-        layers[int(lid)].append(n)
-    return dict(layers)
+        lid = int(lid)
+        layers[lid].append(n)
+        order[lid].append(n['id'])
+    return dict(layers), dict(order)
+
+
+def group_by_layer(nodes: List[Dict], layer_map: Dict[str, int]) -> Dict[int, List[Dict]]:
+    return group_by_layer_and_order(nodes, layer_map)[0]
 
 
-def barycenter_ordering(layers: Dict[int, List[Dict]], links: List[Dict], iterations: int = 1) -> Dict[int, List[str]]:
+def barycenter_ordering(layers: Dict[int, List[Dict]], links: List[Dict], iterations: int = 1,
+                        adj: Optional[AdjacencyIndex] = None,
+                        order: Optional[Dict[int, List[str]]] = None) -> Dict[int, List[str]]:
     """Return ordering (list of node ids per layer) after simple barycenter passes.
     We perform top-down then bottom-up passes for 'iterations' times.
+
+    adj is the shared CSR adjacency; when omitted it is built locally so the
+    public signature keeps working standalone. order is the initial per-layer
+    id lists (as produced by group_by_layer_and_order); when omitted it is
+    derived from layers.
     """
-    # adjacency maps
-    preds = defaultdict(list)
-    succs = defaultdict(list)
-    for l in links:
-        preds[l['target']].append(l['source'])
-        succs[l['source']].append(l['target'])
+    if adj is None:
+        adj = build_csr([n for ns in layers.values() for n in ns], links)
 
-    order = {layer: [n['id'] for n in nodes] for layer, nodes in layers.items()}
+    if order is None:
+        order = {layer: [n['id'] for n in nodes] for layer, nodes in layers.items()}
+
+    id_to_idx = adj.id_to_idx
+
+    # in-layer position of every node, indexed by integer node id; refreshed
+    # only for the one layer that was just reordered
+    pos_of = np.zeros(adj.n, dtype=np.int64)
+
+    def sync_positions(ids: List[str]):
+        for i, nid in enumerate(ids):
+            pos_of[id_to_idx[nid]] = i
+
+    for ids in order.values():
+        sync_positions(ids)
+
+    # neighbor sets never change across passes, so materialize each node's
+    # in/out slice views once instead of re-slicing the CSR every iteration
+    in_nbrs = {nid: adj.in_slice(j) for nid, j in id_to_idx.items()}
+    out_nbrs = {nid: adj.out_slice(j) for nid, j in id_to_idx.items()}
 
     def barycenter(layer_idx: int, upward: bool):
         ids = order[layer_idx]
-        weights = {}
-        for nid in ids:
-            neighbors = preds[nid] if upward else succs[nid]
-            if not neighbors:
-                weights[nid] = None
-                continue
-            # compute average index of neighbors in their layer
-            s = 0.0
-            c = 0
-            for nb in neighbors:
-                # find neighbor's position
-                # find layer of neighbor
-                for lidx, lst in order.items():
-                    if nb in lst:
-                        pos = lst.index(nb)
-                        s += pos
-                        c += 1
-                        break
-            weights[nid] = (s / c) if c else None
-        # sort by barycenter where present, preserving relative order for None
-        with_b = [(nid, weights[nid]) for nid in ids]
-        # nodes with None barycenter keep their order but placed after those with values
-        has = [x for x in with_b if x[1] is not None]
-        nothas = [x for x in with_b if x[1] is None]
-        has.sort(key=lambda x: x[1])
-        new_order = [x[0] for x in has] + [x[0] for x in nothas]
+        # +inf marks nodes without neighbors: a stable argsort then keeps
+        # them after the weighted nodes, in their original relative order
+        if _HAVE_BARYCENTER_KERNEL and len(ids) >= _KERNEL_MIN_LAYER:
+            layer_nodes = np.fromiter((id_to_idx[nid] for nid in ids),
+                                      dtype=np.int64, count=len(ids))
+            if upward:
+                weights = _barycenter_weights(layer_nodes, adj.in_indptr,
+                                              adj.in_neighbors, pos_of)
+            else:
+                weights = _barycenter_weights(layer_nodes, adj.out_indptr,
+                                              adj.out_neighbors, pos_of)
+        else:
+            nbrs = in_nbrs if upward else out_nbrs
+            weights = np.full(len(ids), np.inf)
+            for i, nid in enumerate(ids):
+                neighbors = nbrs[nid]
+                if neighbors.size:
+                    # average in-layer position of the neighbors — a
+                    # contiguous array slice plus one vectorized mean
+                    weights[i] = pos_of[neighbors].mean()
+        new_order = [ids[i] for i in np.argsort(weights, kind='stable')]
+        if new_order == ids:
+            return False
         order[layer_idx] = new_order
+        sync_positions(new_order)
+        return True
 
+    # singleton/empty layers are trivially ordered — deep graphs full of
+    # dummy-only layers skip most of the sweep this way
     layer_indices = sorted(order.keys())
+    top_down = [li for li in layer_indices[1:] if len(order[li]) > 1]
+    bottom_up = [li for li in reversed(layer_indices[:-1]) if len(order[li]) > 1]
     for _ in range(iterations):
-        # top-down
-        for li in layer_indices[1:]:
-            barycenter(li, upward=True)
-        # bottom-up
-        for li in reversed(layer_indices[:-1]):
-            barycenter(li, upward=False)
+        changed = False
+        for li in top_down:
+            changed |= barycenter(li, upward=True)
+        for li in bottom_up:
+            changed |= barycenter(li, upward=False)
+        # converged — further passes would recompute identical orders
+        if not changed:
+            break
     return order
 
 
@@ -235,96 +420,169 @@ def compute_positions(layers: Dict[int, List[Dict]], ordering: Dict[int, List[st
 
     for li, nodes_in_layer in layers.items():
         ordered_ids = ordering.get(li, [n['id'] for n in nodes_in_layer])
+        if not ordered_ids:
+            continue
         # compute total value for scaling
-        vals = [node_values.get(nid, 1.0) for nid in ordered_ids]
-        total_val = sum(vals) if vals else 1.0
+        vals = np.fromiter((node_values.get(nid, 1.0) for nid in ordered_ids),
+                           dtype=np.float64, count=len(ordered_ids))
+        total_val = vals.sum() or 1.0
         # allocate available height
         avail_height = height - 40
         # determine scaling factor so that sum of node heights + paddings fits avail_height
         # initial naive height: proportional to value with a minimal size
         min_node_h = 6
-        raw_heights = [max(min_node_h, (v / total_val) * (avail_height * 0.6)) for v in vals]
-        # compute the y positions stacked from top=20
-        y = 20
-        for nid, h in zip(ordered_ids, raw_heights):
-            x = layer_xs.get(li, 20)
-            positions[nid] = (x, y + h / 2)
+        heights = np.maximum(min_node_h, (vals / total_val) * (avail_height * 0.6))
+        # stacked tops from y=20: one cumsum instead of a running total per node
+        steps = heights + node_padding
+        tops = 20 + np.cumsum(steps) - steps
+        centers_y = tops + heights / 2
+        x = layer_xs.get(li, 20)
+        for nid, cy, h in zip(ordered_ids, centers_y, heights):
+            positions[nid] = (x, cy)
             sizes[nid] = (node_width, h)
-            y += h + node_padding
 
     return positions, sizes
 
 
+# SVG element templates: %-formatting with a tuple runs one C-level format
+# call per element instead of one FORMAT_VALUE per interpolated float
+_PATH_FMT = '<path d="M %.2f,%.2f C %.2f,%.2f %.2f,%.2f %.2f,%.2f" class="link" stroke-width="%.2f" stroke="#888" />\n'
+_RECT_FMT = '<rect x="%.2f" y="%.2f" width="%.2f" height="%.2f" class="node"/>\n'
+_DUMMY_RECT_FMT = '<rect x="%.2f" y="%.2f" width="%.2f" height="%.2f" fill="#ccc" stroke="#666" stroke-dasharray="2,2"/>\n'
+_LABEL_FMT = '<text x="%.2f" y="%.2f" class="label">%s</text>\n'
+
+
 def render_svg(nodes: List[Dict], links: List[Dict], positions: Dict[str, Tuple[float, float]], sizes: Dict[str, Tuple[float, float]],
-               layer_map: Dict[str, int], filename: str = 'output.svg', width: int = 800, height: int = 600):
+               layer_map: Dict[str, int], filename: str = 'output.svg', width: int = 800, height: int = 600,
+               adj: Optional[AdjacencyIndex] = None,
+               node_by_id: Optional[Dict[str, Dict]] = None):
     """Render a very simple SVG: nodes as rects and links as cubic Bezier curves between layer centers."""
-    def esc(s: str) -> str:
-        return (s.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;') if s else '')
+    esc = _esc
+
+    if node_by_id is None:
+        node_by_id = {n['id']: n for n in nodes}
+    if adj is None:
+        adj = build_csr(nodes, links)
+
+    # stream straight into a buffered file handle: no output list, no final
+    # '\n'.join doubling peak memory on large diagrams
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        write = f.write
+        write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n')
+        write('<style> .node {fill:#1f77b4; stroke:#000; stroke-width:0.5;} .label{font:12px sans-serif; fill:#000;} .link{fill:none; stroke:#999; stroke-opacity:0.5;} </style>\n')
+
+        # positions/sizes as SoA arrays indexed by integer node id: five dict
+        # lookups per link become plain integer indexing
+        pos_arr = np.zeros((adj.n, 2))
+        size_arr = np.full((adj.n, 2), 10.0)
+        has_pos = np.zeros(adj.n, dtype=bool)
+        id_to_idx = adj.id_to_idx
+        for nid, p in positions.items():
+            j = id_to_idx.get(nid)
+            if j is not None:
+                pos_arr[j] = p
+                has_pos[j] = True
+        for nid, s in sizes.items():
+            j = id_to_idx.get(nid)
+            if j is not None:
+                size_arr[j] = s
+
+        # draw links first so nodes are on top; geometry is whole-array
+        # arithmetic over the CSR edge arrays
+        # sentinel (-1) endpoints can never be positioned; mask them before
+        # gathering so the -1 does not wrap around to the last node
+        valid = (adj.src >= 0) & (adj.tgt >= 0)
+        valid &= has_pos[np.where(valid, adj.src, 0)] & has_pos[np.where(valid, adj.tgt, 0)]
+        if valid.any():
+            src_i = adj.src[valid]
+            tgt_i = adj.tgt[valid]
+            x1 = pos_arr[src_i, 0]
+            y1 = pos_arr[src_i, 1]
+            w1 = size_arr[src_i, 0]
+            x2 = pos_arr[tgt_i, 0]
+            y2 = pos_arr[tgt_i, 1]
+            w2 = size_arr[tgt_i, 0]
+            vals = adj.val[valid]
+            m = len(src_i)
+
+            # if target is to the right, start at x1 + w/2 else x1 - w/2
+            rightward = x2 >= x1
+            start_x = np.where(rightward, x1 + w1 / 2, x1 - w1 / 2)
+            end_x = np.where(rightward, x2 - w2 / 2, x2 + w2 / 2)
+            dx = (end_x - start_x) * 0.3
+            c1x = start_x + dx
+            c2x = end_x - dx
+            stroke_w = np.maximum(1.0, np.sqrt(vals))
+
+            for i in range(m):
+                write(_PATH_FMT % (start_x[i], y1[i], c1x[i], y1[i],
+                                   c2x[i], y2[i], end_x[i], y2[i], stroke_w[i]))
+
+        # draw nodes
+        for nid, (x, y) in positions.items():
+            w, h = sizes.get(nid, (10, 10))
+            rx = x - w/2
+            ry = y - h/2
+            node = node_by_id.get(nid, {})
+            # dummy nodes are rendered faintly
+            if node.get('dummy'):
+                write(_DUMMY_RECT_FMT % (rx, ry, w, h))
+            else:
+                write(_RECT_FMT % (rx, ry, w, h))
+                label = node.get('label') or nid
+                write(_LABEL_FMT % (x + w / 2 + 6, y + 4, esc(label)))
 
-    node_by_id = {n['id']: n for n in nodes}
+        write('</svg>')
 
-    svg = []
-    svg.append(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">')
-    svg.append('<style> .node {fill:#1f77b4; stroke:#000; stroke-width:0.5;} .label{font:12px sans-serif; fill:#000;} .link{fill:none; stroke:#999; stroke-opacity:0.5;} </style>')
 
-    # draw links first so nodes are on top
-    for l in links:
-        s = l['source']
-        t = l['target']
-        if s not in positions or t not in positions:
-            continue
-        x1, y1 = positions[s]
-        w1, h1 = sizes.get(s, (10,10))
-        x2, y2 = positions[t]
-        w2, h2 = sizes.get(t, (10,10))
-        # compute left/right edge points
-        # if target is to the right, start at x1 + w/2 else x1 - w/2
-        start_x = x1 + w1/2 if (x2 >= x1) else x1 - w1/2
-        end_x = x2 - w2/2 if (x2 >= x1) else x2 + w2/2
-        # control points
-        dx = (end_x - start_x) * 0.3
-        c1x = start_x + dx
-        c1y = y1
-        c2x = end_x - dx
-        c2y = y2
-        stroke_w = max(1.0, math.sqrt(l.get('value', 1.0)))
-        path = f'M {start_x:.2f},{y1:.2f} C {c1x:.2f},{c1y:.2f} {c2x:.2f},{c2y:.2f} {end_x:.2f},{y2:.2f}'
-        svg.append(f'<path d="{path}" class="link" stroke-width="{stroke_w:.2f}" stroke="#888" />')
-
-    # draw nodes
-    for nid, (x, y) in positions.items():
-        w, h = sizes.get(nid, (10, 10))
-        rx = x - w/2
-        ry = y - h/2
-        node = node_by_id.get(nid, {})
-        cls = 'node'
-        # dummy nodes are rendered faintly
-        if node.get('dummy'):
-            svg.append(f'<rect x="{rx:.2f}" y="{ry:.2f}" width="{w:.2f}" height="{h:.2f}" fill="#ccc" stroke="#666" stroke-dasharray="2,2"/>')
-        else:
-            svg.append(f'<rect x="{rx:.2f}" y="{ry:.2f}" width="{w:.2f}" height="{h:.2f}" class="node"/>')
-            label = node.get('label') or nid
-            svg.append(f'<text x="{x + w/2 + 6:.2f}" y="{y + 4:.2f}" class="label">{esc(label)}</text>')
+def _is_two_layer(nodes: List[Dict], segments: Optional[List[str]]) -> bool:
+    """True for the legacy sources/targets shape: exactly two segments with
+    every node carrying an explicit 0/1 segment index."""
+    if segments is None or len(segments) != 2:
+        return False
+    return all(n.get('segment') in (0, 1) for n in nodes)
+
 
-    svg.append('</svg>')
+def _run_pipeline_2layer_fast(nodes: List[Dict], links: List[Dict], output_svg: str,
+                              width: int = 1000, height: int = 600):
+    """Fast path for two-layer graphs: layers are fixed by construction and no
+    link can span more than one layer, so topology inference and
+    split_long_links are skipped. Ordering still runs the full two-iteration
+    barycenter sweep (top-down and bottom-up both touch only one layer here)
+    so the fast path lays out identically to the general pipeline."""
+    layer_map = {n['id']: int(n['segment']) for n in nodes}
+    adj = build_csr(nodes, links)
+    node_vals = compute_node_values(nodes, links, adj=adj)
+    layers, init_order = group_by_layer_and_order(nodes, layer_map)
+    ordering = barycenter_ordering(layers, links, iterations=2, adj=adj, order=init_order)
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(svg))
+    positions, sizes = compute_positions(layers, ordering, node_vals, width=width, height=height)
+    render_svg(nodes, links, positions, sizes, layer_map, filename=output_svg,
+               width=width, height=height, adj=adj,
+               node_by_id={n['id']: n for n in nodes})
 
 
 def run_pipeline(input_path: str, output_svg: str = 'demo_multi_segment.svg'):
     nodes, links, segments = load_input(input_path)
+    if _is_two_layer(nodes, segments):
+        _run_pipeline_2layer_fast(nodes, links, output_svg)
+        return
     new_nodes, new_links, layer_map = build_internal_graph(nodes, links, segments)
+    # shared per-run lookup structures: id -> node map and CSR adjacency are
+    # built once here and threaded through every downstream stage
+    node_by_id = {n['id']: n for n in new_nodes}
+    adj = build_csr(new_nodes, new_links)
     # compute node values
-    node_vals = compute_node_values(new_nodes, new_links)
-    # group by layer
-    layers = group_by_layer(new_nodes, layer_map)
+    node_vals = compute_node_values(new_nodes, new_links, adj=adj)
+    # group by layer (initial ordering falls out of the same sweep)
+    layers, init_order = group_by_layer_and_order(new_nodes, layer_map)
     # ordering
-    ordering = barycenter_ordering(layers, new_links, iterations=2)
+    ordering = barycenter_ordering(layers, new_links, iterations=2, adj=adj, order=init_order)
     # positions
     positions, sizes = compute_positions(layers, ordering, node_vals, width=1000, height=600)
     # render
-    render_svg(new_nodes, new_links, positions, sizes, layer_map, filename=output_svg, width=1000, height=600)
+    render_svg(new_nodes, new_links, positions, sizes, layer_map, filename=output_svg, width=1000, height=600,
+               adj=adj, node_by_id=node_by_id)
 
 
 if __name__ == '__main__':
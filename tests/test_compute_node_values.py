@@ -0,0 +1,29 @@
+# tests for node value accumulation, including dangling links
+import pytest
+import sankey_pipelone
+import sankey_pipeline
+
+NODES = [
+    {"id": "A", "segment": 0},
+    {"id": "A2", "segment": 0},
+    {"id": "B", "segment": 1},
+    {"id": "C", "segment": 1},
+]
+# the second link dangles: its target is not a known node, but its value
+# must still count toward A (split_long_links keeps such links as-is too)
+LINKS = [
+    {"source": "A", "target": "B", "value": 5},
+    {"source": "A", "target": "MISSING", "value": 25},
+    {"source": "A2", "target": "C", "value": 5},
+]
+
+def test_dangling_link_counts_known_endpoint():
+    vals = sankey_pipelone.compute_node_values(NODES, LINKS)
+    assert vals["A"] == 30.0
+    assert vals["A2"] == 5.0
+    assert vals["B"] == 5.0
+
+def test_twin_modules_agree_on_dangling_links():
+    v1 = sankey_pipelone.compute_node_values(NODES, LINKS)
+    v2 = sankey_pipeline.compute_node_values(NODES, LINKS)
+    assert v1 == v2
@@ -0,0 +1,35 @@
+# tests for sankey_diagram parsing and validation
+import pytest
+from sankey_diagram import parse_text_format, load_input_data, validate_flows
+
+def test_tab_padded_section_headers():
+    text = "Left\t\nA=10\n\nRight\t\nM= 10 from A\n"
+    left, right = parse_text_format(text)
+    assert left == {"A": 10.0}
+    assert right == {"M": [("A", 10.0)]}
+
+def test_tab_separated_flows():
+    text = "Left\nA=5\nB=5\nRight\nM=\t5\tfrom\tA,  5   from   B\n"
+    left, right = parse_text_format(text)
+    assert right == {"M": [("A", 5.0), ("B", 5.0)]}
+
+def test_trailing_garbage_is_dropped():
+    # a malformed left line is discarded entirely rather than parsed as a
+    # numeric prefix, and a flow token with extra words is skipped
+    text = "Left\nA=10 junk\nB=20\nRight\nM= 5 from B extra, 10 from B\n"
+    left, right = parse_text_format(text)
+    assert left == {"B": 20.0}
+    assert right == {"M": [("B", 10.0)]}
+
+def test_duplicate_right_node_line_totals(tmp_path):
+    # a repeated right-node line replaces the earlier one; the parsed totals
+    # must reflect only the surviving flows, so validation fails here just
+    # like a fresh traversal of right_nodes would
+    p = tmp_path / "dup.txt"
+    p.write_text("Left\nA=10\nRight\nM= 5 from A\nM= 5 from A\n")
+    left, right, meta = load_input_data(str(p))
+    assert right == {"M": [("A", 5.0)]}
+    assert meta["left_totals"] == {"A": 5.0}
+    assert validate_flows(left, right, verbose=False,
+                          left_totals=meta["left_totals"]) is False
+    assert validate_flows(left, right, verbose=False) is False